@@ -15,10 +15,12 @@
 # specific language governing permissions and limitations
 # under the License.
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 
 import click
 from celery.utils.abstract import CallableTask
+from flask import current_app
 from flask.cli import with_appcontext
 
 from superset.extensions import db
@@ -84,16 +86,33 @@ def compute_thumbnails(
             query = query.filter(model_cls.id.in_(model_ids))
         dashboards = query.all()
         count = len(dashboards)
-        for i, model in enumerate(dashboards):
-            if asynchronous:
-                func = compute_func.delay
-                action = "Triggering"
-            else:
-                func = compute_func
-                action = "Processing"
-            msg = f'{action} {friendly_type} "{model}" ({i+1}/{count})'
-            click.secho(msg, fg="green")
-            func(None, model.id, force=force)
+        if asynchronous:
+            for i, model in enumerate(dashboards):
+                msg = f'Triggering {friendly_type} "{model}" ({i+1}/{count})'
+                click.secho(msg, fg="green")
+                compute_func.delay(None, model.id, force=force)
+            return
+
+        # Each worker captures with its own webdriver, and resolves the user to
+        # capture as in its own app context, as sessions aren't shared across threads
+        # pylint: disable=protected-access
+        app = current_app._get_current_object()  # type: ignore[attr-defined]
+
+        def compute(i: int, model_id: int, model_name: str) -> None:
+            with app.app_context():
+                msg = f'Processing {friendly_type} "{model_name}" ({i+1}/{count})'
+                click.secho(msg, fg="green")
+                compute_func(None, model_id, force=force)
+
+        with ThreadPoolExecutor(
+            max_workers=app.config["THUMBNAIL_CONCURRENCY"]
+        ) as executor:
+            futures = [
+                executor.submit(compute, i, model.id, str(model))
+                for i, model in enumerate(dashboards)
+            ]
+        for future in futures:
+            future.result()
 
     if not charts_only:
         compute_generic_thumbnail(
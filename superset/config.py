@@ -656,6 +656,10 @@ THUMBNAIL_CACHE_CONFIG: CacheConfig = {
     "CACHE_NO_NULL_WARNING": True,
 }
 
+# Maximum number of thumbnails captured concurrently, each with its own webdriver,
+# by the synchronous `superset compute-thumbnails` command
+THUMBNAIL_CONCURRENCY = 4
+
 # Time before selenium times out after trying to locate an element on the page and wait
 # for that element to load for a screenshot.
 SCREENSHOT_LOCATE_WAIT = int(timedelta(seconds=10).total_seconds())
@@ -933,7 +933,9 @@ class DashboardRestApi(BaseSupersetModelRestApi):
             )
         self.incr_stats("from_cache", self.thumbnail.__name__)
         return Response(
-            FileWrapper(screenshot), mimetype="image/png", direct_passthrough=True
+            FileWrapper(screenshot),
+            mimetype=f"image/{DashboardScreenshot.thumbnail_format}",
+            direct_passthrough=True,
         )
 
     @expose("/favorite_status/", methods=("GET",))
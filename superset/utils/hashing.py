@@ -32,3 +32,21 @@ def md5_sha_from_dict(
     json_data = json.dumps(obj, sort_keys=True, ignore_nan=ignore_nan, default=default)
 
     return md5_sha_from_str(json_data)
+
+
+def fast_hash_from_str(val: str) -> str:
+    """
+    Hash for opaque keys such as cache keys, not for anything security related.
+    Uses a 128-bit BLAKE2b digest, the same size as MD5.
+    """
+    return hashlib.blake2b(val.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def fast_hash_from_dict(
+    obj: dict[Any, Any],
+    ignore_nan: bool = False,
+    default: Optional[Callable[[Any], Any]] = None,
+) -> str:
+    json_data = json.dumps(obj, sort_keys=True, ignore_nan=ignore_nan, default=default)
+
+    return fast_hash_from_str(json_data)
@@ -16,13 +16,16 @@
 # under the License.
 from __future__ import annotations
 
+import base64
+import hashlib
 import logging
+import time
 from io import BytesIO
-from typing import TYPE_CHECKING
+from typing import Any, TYPE_CHECKING
 
 from flask import current_app
 
-from superset.utils.hashing import md5_sha_from_dict
+from superset.utils.hashing import fast_hash_from_dict
 from superset.utils.urls import modify_url_query
 from superset.utils.webdriver import (
     ChartStandaloneMode,
@@ -33,33 +36,113 @@ from superset.utils.webdriver import (
 
 logger = logging.getLogger(__name__)
 
+# optional, decodes the PNG screenshots faster than Pillow when installed
+try:
+    import imagecodecs
+except ModuleNotFoundError:
+    imagecodecs = None
+
 DEFAULT_SCREENSHOT_WINDOW_SIZE = 800, 600
 DEFAULT_SCREENSHOT_THUMBNAIL_SIZE = 400, 300
 DEFAULT_CHART_WINDOW_SIZE = DEFAULT_CHART_THUMBNAIL_SIZE = 800, 600
 DEFAULT_DASHBOARD_WINDOW_SIZE = 1600, 1200
 DEFAULT_DASHBOARD_THUMBNAIL_SIZE = 800, 600
-
-try:
-    from PIL import Image
-except ModuleNotFoundError:
-    logger.info("No PIL installation found")
+# Seconds after which a thumbnail computation lock expires, and for how long
+# concurrent requests wait on the locked computation to cache the thumbnail
+THUMBNAIL_LOCK_TIMEOUT = 300
+THUMBNAIL_LOCK_WAIT = 30
+# How much larger than the thumbnail screenshots are still resized with Lanczos,
+# anything beyond that is reduced by an integer factor first
+THUMBNAIL_REDUCING_GAP = 2.0
+THUMBNAIL_SAVE_OPTIONS: dict[str, dict[str, Any]] = {
+    "jpeg": {"quality": 85},
+    "webp": {"quality": 85, "method": 4},
+}
 
 if TYPE_CHECKING:
+    from types import ModuleType
+
     from flask_appbuilder.security.sqla.models import User
     from flask_caching import Cache
 
 
+def _lazy_image() -> ModuleType:
+    """
+    Imports PIL only when a thumbnail is resized, as it's an optional dependency
+    not needed by processes that never render thumbnails
+    """
+    # pylint: disable=import-outside-toplevel
+    from PIL import Image
+
+    return Image
+
+
+def _decode_png(img_bytes: bytes) -> Any:
+    """
+    Decodes a PNG screenshot with imagecodecs (libspng) when it's installed, which
+    is faster than Pillow's libpng based decoder. Returns None when imagecodecs is
+    missing or can't handle the image, so that Pillow decodes it instead.
+    """
+    if imagecodecs is None:
+        return None
+    try:
+        arr = imagecodecs.png_decode(img_bytes)
+    except Exception as ex:  # pylint: disable=broad-except
+        logger.debug("Failed at decoding with imagecodecs %s", ex)
+        return None
+    mode = {3: "RGB", 4: "RGBA"}.get(arr.shape[-1]) if arr.ndim == 3 else None
+    if mode is None or arr.dtype.name != "uint8":
+        return None
+    return _lazy_image().frombuffer(
+        mode, (arr.shape[1], arr.shape[0]), arr, "raw", mode, 0, 1
+    )
+
+
 class BaseScreenshot:
-    driver_type = current_app.config["WEBDRIVER_TYPE"]
+    # Thumbnails can be computed in bulk, slots keep instances small
+    __slots__ = (
+        "digest",
+        "url",
+        "screenshot",
+        "window_size",
+        "thumb_size",
+        "_cache_keys",
+    )
+
     thumbnail_type: str = ""
+    thumbnail_format: str = "png"
     element: str = ""
-    window_size: WindowSize = DEFAULT_SCREENSHOT_WINDOW_SIZE
-    thumb_size: WindowSize = DEFAULT_SCREENSHOT_THUMBNAIL_SIZE
+    standalone: ChartStandaloneMode | DashboardStandaloneMode | None = None
+    default_window_size: WindowSize = DEFAULT_SCREENSHOT_WINDOW_SIZE
+    default_thumb_size: WindowSize = DEFAULT_SCREENSHOT_THUMBNAIL_SIZE
 
-    def __init__(self, url: str, digest: str):
+    def __init__(
+        self,
+        url: str,
+        digest: str,
+        window_size: WindowSize | None = None,
+        thumb_size: WindowSize | None = None,
+    ):
         self.digest: str = digest
         self.url = url
         self.screenshot: bytes | None = None
+        self.window_size: WindowSize = window_size or self.default_window_size
+        self.thumb_size: WindowSize = thumb_size or self.default_thumb_size
+        self._cache_keys: dict[tuple[WindowSize, WindowSize], str] = {}
+
+    @property
+    def standalone_url(self) -> str:
+        """
+        The url to capture, in the standalone mode of the screenshot type. Only
+        built when capturing, so that cache lookups don't need to parse the url.
+        """
+        if self.standalone is None:
+            return self.url
+        return modify_url_query(self.url, standalone=self.standalone.value)
+
+    @property
+    def driver_type(self) -> str:
+        return current_app.config["WEBDRIVER_TYPE"]
 
     def driver(self, window_size: WindowSize | None = None) -> WebDriverProxy:
         window_size = window_size or self.window_size
@@ -67,25 +150,49 @@ class BaseScreenshot:
 
     def cache_key(
         self,
-        window_size: bool | WindowSize | None = None,
-        thumb_size: bool | WindowSize | None = None,
+        window_size: WindowSize | None = None,
+        thumb_size: WindowSize | None = None,
     ) -> str:
         window_size = window_size or self.window_size
         thumb_size = thumb_size or self.thumb_size
+        # sizes may come in as lists when deserialized from a celery task
+        key = ((window_size[0], window_size[1]), (thumb_size[0], thumb_size[1]))
+        if (cache_key := self._cache_keys.get(key)) is None:
+            args = {
+                "thumbnail_type": self.thumbnail_type,
+                "digest": self.digest,
+                "type": "thumb",
+                "format": self.thumbnail_format,
+                "window_size": window_size,
+                "thumb_size": thumb_size,
+            }
+            cache_key = self._cache_keys[key] = fast_hash_from_dict(args)
+        return cache_key
+
+    def content_cache_key(
+        self,
+        payload: bytes,
+        thumb_size: WindowSize | None = None,
+    ) -> str:
+        """
+        Cache key of the thumbnail computed from a given raw screenshot, so that
+        byte-identical screenshots can reuse the thumbnail instead of resizing again
+        """
+        thumb_size = thumb_size or self.thumb_size
         args = {
             "thumbnail_type": self.thumbnail_type,
-            "digest": self.digest,
-            "type": "thumb",
-            "window_size": window_size,
+            "content": hashlib.blake2b(payload, digest_size=16).hexdigest(),
+            "type": "thumb_content",
+            "format": self.thumbnail_format,
             "thumb_size": thumb_size,
         }
-        return md5_sha_from_dict(args)
+        return fast_hash_from_dict(args)
 
     def get_screenshot(
         self, user: User, window_size: WindowSize | None = None
     ) -> bytes | None:
         driver = self.driver(window_size)
-        self.screenshot = driver.get_screenshot(self.url, self.element, user)
+        self.screenshot = driver.get_screenshot(self.standalone_url, self.element, user)
         return self.screenshot
 
     def get(
@@ -106,8 +213,9 @@ class BaseScreenshot:
         if cache:
             payload = cache.get(cache_key)
         if not payload:
+            # the cache was just probed, force skips probing it again
             payload = self.compute_and_cache(
-                user=user, thumb_size=thumb_size, cache=cache
+                user=user, thumb_size=thumb_size, cache=cache, force=True
             )
         else:
             logger.info("Loaded thumbnail from cache: %s", cache_key)
@@ -132,6 +240,49 @@ class BaseScreenshot:
         logger.info("Failed at getting from cache: %s", cache_key)
         return None
 
+    def get_b64(
+        self,
+        cache: Cache,
+        window_size: WindowSize | None = None,
+        thumb_size: WindowSize | None = None,
+    ) -> bytes | None:
+        """
+        Get the base64 encoded thumbnail from cache, e.g. to embed it as a data URI.
+        The encoding is cached along with the thumbnail, thumbnails cached before
+        that are encoded on the fly.
+
+        :param cache: The cache to use
+        :param window_size: Override window size
+        :param thumb_size: Override thumbnail size
+        """
+        cache_key = self.cache_key(window_size, thumb_size)
+        b64_cache_key = f"{cache_key}:b64"
+        if payload := cache.get(b64_cache_key):
+            return payload
+        if payload := cache.get(cache_key):
+            # Not cached back, it could overwrite the encoding of a newer thumbnail
+            return base64.b64encode(payload)
+        return None
+
+    @staticmethod
+    def get_many_from_cache(
+        cache: Cache, screenshots: list[BaseScreenshot]
+    ) -> dict[str, BytesIO]:
+        """
+        Get multiple thumbnails from the cache in a single round-trip
+
+        :param cache: The cache to use
+        :param screenshots: The screenshots to look up
+        :return: The cached thumbnails, by cache key
+        """
+        cache_keys = [screenshot.cache_key() for screenshot in screenshots]
+        payloads = cache.get_many(*cache_keys)  # type: ignore[no-untyped-call]
+        return {
+            cache_key: BytesIO(payload)
+            for cache_key, payload in zip(cache_keys, payloads)
+            if payload
+        }
+
     def compute_and_cache(  # pylint: disable=too-many-arguments
         self,
         user: User = None,
@@ -156,6 +307,29 @@ class BaseScreenshot:
         if not force and cache and cache.get(cache_key):
             logger.info("Thumb already cached, skipping...")
             return None
+
+        # Only one process computes a given thumbnail, concurrent requests wait
+        # for it to be cached instead of capturing the same screenshot again
+        lock_key = f"lock::{cache_key}"
+        if cache and not cache.add(lock_key, "1", timeout=THUMBNAIL_LOCK_TIMEOUT):
+            logger.info("Thumb already being computed, waiting: %s", cache_key)
+            return self.wait_for_cache_key(cache, cache_key)
+        try:
+            return self._compute_and_cache(
+                user, window_size, thumb_size, cache, cache_key
+            )
+        finally:
+            if cache:
+                cache.delete(lock_key)
+
+    def _compute_and_cache(  # pylint: disable=too-many-arguments
+        self,
+        user: User,
+        window_size: WindowSize,
+        thumb_size: WindowSize,
+        cache: Cache,
+        cache_key: str,
+    ) -> bytes | None:
         logger.info("Processing url for thumbnail: %s", cache_key)
 
         payload = None
@@ -166,84 +340,123 @@ class BaseScreenshot:
         except Exception as ex:  # pylint: disable=broad-except
             logger.warning("Failed at generating thumbnail %s", ex, exc_info=True)
 
-        if payload and window_size != thumb_size:
-            try:
-                payload = self.resize_image(payload, thumb_size=thumb_size)
-            except Exception as ex:  # pylint: disable=broad-except
-                logger.warning("Failed at resizing thumbnail %s", ex, exc_info=True)
-                payload = None
+        # Selenium captures PNGs, other formats are encoded even at the same size
+        if payload and (window_size != thumb_size or self.thumbnail_format != "png"):
+            content_key = self.content_cache_key(payload, thumb_size)
+            if cache and (thumb := cache.get(content_key)):
+                logger.info("Screenshot unchanged, reusing thumbnail: %s", content_key)
+                payload = thumb
+            else:
+                try:
+                    payload = self.resize_image(
+                        payload, output=self.thumbnail_format, thumb_size=thumb_size
+                    )
+                except Exception as ex:  # pylint: disable=broad-except
+                    logger.warning("Failed at resizing thumbnail %s", ex, exc_info=True)
+                    payload = None
+                if payload and cache:
+                    cache.set(content_key, payload)
 
         if payload:
             logger.info("Caching thumbnail: %s", cache_key)
             cache.set(cache_key, payload)
+            cache.set(f"{cache_key}:b64", base64.b64encode(payload))
             logger.info("Done caching thumbnail")
         return payload
 
+    @staticmethod
+    def wait_for_cache_key(cache: Cache, cache_key: str) -> bytes | None:
+        """
+        Polls the cache with an exponential backoff until the payload is set,
+        giving up after `THUMBNAIL_LOCK_WAIT` seconds
+        """
+        delay = 0.1
+        deadline = time.monotonic() + THUMBNAIL_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            if payload := cache.get(cache_key):
+                return payload
+            delay = min(delay * 2, 5)
+        logger.warning("Timed out waiting for thumbnail: %s", cache_key)
+        return None
+
     @classmethod
     def resize_image(
         cls,
-        img_bytes: bytes,
+        img_bytes: bytes | BytesIO,
         output: str = "png",
         thumb_size: WindowSize | None = None,
         crop: bool = True,
     ) -> bytes:
-        thumb_size = thumb_size or cls.thumb_size
-        img = Image.open(BytesIO(img_bytes))
+        Image = _lazy_image()  # pylint: disable=invalid-name
+        thumb_size = thumb_size or cls.default_thumb_size
+        # Streams are left to Pillow, imagecodecs would need their buffer exported,
+        # which copies the bytes a BytesIO shares
+        img = _decode_png(img_bytes) if isinstance(img_bytes, bytes) else None
+        if img is None:
+            # Wrapping bytes in a BytesIO shares their buffer, streams are read as is
+            img = Image.open(
+                BytesIO(img_bytes) if isinstance(img_bytes, bytes) else img_bytes
+            )
         logger.debug("Selenium image size: %s", str(img.size))
-        if crop and img.size[1] != cls.window_size[1]:
-            desired_ratio = float(cls.window_size[1]) / cls.window_size[0]
+        # The crop is fused into the resampling through its ``box`` argument,
+        # avoiding an intermediate copy of the cropped image
+        box = (0, 0, img.size[0], img.size[1])
+        if crop and img.size[1] != cls.default_window_size[1]:
+            desired_ratio = cls.default_window_size[1] / cls.default_window_size[0]
             desired_width = int(img.size[0] * desired_ratio)
             logger.debug("Cropping to: %s*%s", str(img.size[0]), str(desired_width))
-            img = img.crop((0, 0, img.size[0], desired_width))
-        logger.debug("Resizing to %s", str(thumb_size))
-        img = img.resize(thumb_size, Image.Resampling.LANCZOS)
-        new_img = BytesIO()
-        if output != "png":
+            box = (0, 0, img.size[0], desired_width)
+            if desired_width > img.size[1]:
+                # A box can't extend past the image, crop pads it instead
+                img = img.crop(box)
+        if output != "png" and img.mode != "RGB":
+            # Drop the alpha channel before resizing rather than after, so the
+            # Lanczos filter only goes through three channels
             img = img.convert("RGB")
-        img.save(new_img, output)
-        new_img.seek(0)
-        return new_img.read()
+        logger.debug("Resizing to %s", str(thumb_size))
+        # Pillow first reduces large screenshots by an integer factor with the cheap
+        # box filter, leaving at least twice the thumbnail size to the Lanczos filter
+        img = img.resize(
+            thumb_size,
+            resample=Image.Resampling.LANCZOS,
+            box=box,
+            reducing_gap=THUMBNAIL_REDUCING_GAP,
+        )
+        with BytesIO() as new_img:
+            # Grow the buffer once upfront, rather than repeatedly while encoding
+            new_img.seek(thumb_size[0] * thumb_size[1] - 1)
+            new_img.write(b"\0")
+            new_img.seek(0)
+            img.save(new_img, output, **THUMBNAIL_SAVE_OPTIONS.get(output, {}))
+            new_img.truncate()
+            return new_img.getvalue()
 
 
 class ChartScreenshot(BaseScreenshot):
+    __slots__ = ()
+
     thumbnail_type: str = "chart"
     element: str = "chart-container"
-
-    def __init__(
-        self,
-        url: str,
-        digest: str,
-        window_size: WindowSize | None = None,
-        thumb_size: WindowSize | None = None,
-    ):
-        # Chart reports are in standalone="true" mode
-        url = modify_url_query(
-            url,
-            standalone=ChartStandaloneMode.HIDE_NAV.value,
-        )
-        super().__init__(url, digest)
-        self.window_size = window_size or DEFAULT_CHART_WINDOW_SIZE
-        self.thumb_size = thumb_size or DEFAULT_CHART_THUMBNAIL_SIZE
+    # Chart reports are in standalone="true" mode
+    standalone: ChartStandaloneMode | DashboardStandaloneMode | None = (
+        ChartStandaloneMode.HIDE_NAV
+    )
+    default_window_size: WindowSize = DEFAULT_CHART_WINDOW_SIZE
+    default_thumb_size: WindowSize = DEFAULT_CHART_THUMBNAIL_SIZE
 
 
 class DashboardScreenshot(BaseScreenshot):
+    __slots__ = ()
+
     thumbnail_type: str = "dashboard"
+    # dashboard screenshots are always downsized, so encode them in a lighter format
+    thumbnail_format: str = "webp"
     element: str = "standalone"
-
-    def __init__(
-        self,
-        url: str,
-        digest: str,
-        window_size: WindowSize | None = None,
-        thumb_size: WindowSize | None = None,
-    ):
-        # per the element above, dashboard screenshots
-        # should always capture in standalone
-        url = modify_url_query(
-            url,
-            standalone=DashboardStandaloneMode.REPORT.value,
-        )
-
-        super().__init__(url, digest)
-        self.window_size = window_size or DEFAULT_DASHBOARD_WINDOW_SIZE
-        self.thumb_size = thumb_size or DEFAULT_DASHBOARD_THUMBNAIL_SIZE
+    # per the element above, dashboard screenshots
+    # should always capture in standalone
+    standalone: ChartStandaloneMode | DashboardStandaloneMode | None = (
+        DashboardStandaloneMode.REPORT
+    )
+    default_window_size: WindowSize = DEFAULT_DASHBOARD_WINDOW_SIZE
+    default_thumb_size: WindowSize = DEFAULT_DASHBOARD_THUMBNAIL_SIZE
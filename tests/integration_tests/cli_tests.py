@@ -30,6 +30,7 @@ import superset.cli.importexport
 import superset.cli.thumbnails
 from superset import app, db
 from superset.models.dashboard import Dashboard
+from superset.models.slice import Slice
 from tests.integration_tests.fixtures.birth_names_dashboard import (
     load_birth_names_dashboard_with_slices,
     load_birth_names_data,
@@ -520,3 +521,21 @@ def test_compute_thumbnails(thumbnail_mock, app_context, fs):
         force=False,
     )
     assert response.exit_code == 0
+
+
+@pytest.mark.usefixtures("load_birth_names_dashboard_with_slices")
+@mock.patch("superset.tasks.thumbnails.cache_chart_thumbnail")
+def test_compute_thumbnails_concurrently(thumbnail_mock, app_context, fs):
+    thumbnail_mock.return_value = None
+    runner = app.test_cli_runner()
+    chart_ids = [chart_id for (chart_id,) in db.session.query(Slice.id)]
+    response = runner.invoke(
+        superset.cli.thumbnails.compute_thumbnails,
+        ["-c", "-f"],
+    )
+
+    assert response.exit_code == 0
+    assert sorted(call.args[1] for call in thumbnail_mock.call_args_list) == sorted(
+        chart_ids
+    )
+    assert all(call.kwargs == {"force": True} for call in thumbnail_mock.call_args_list)
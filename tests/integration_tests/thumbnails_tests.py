@@ -392,6 +392,7 @@ class TestThumbnails(SupersetTestCase):
             rv = self.client.get(thumbnail_url)
             self.assertEqual(rv.status_code, 200)
             self.assertEqual(rv.data, self.mock_image)
+            self.assertEqual(rv.headers["Content-Type"], "image/webp")
 
     @pytest.mark.usefixtures("load_birth_names_dashboard_with_slices")
     @with_feature_flags(THUMBNAILS=True)
@@ -20,7 +20,12 @@ from typing import Any
 
 import pytest
 
-from superset.utils.hashing import md5_sha_from_dict, md5_sha_from_str
+from superset.utils.hashing import (
+    fast_hash_from_dict,
+    fast_hash_from_str,
+    md5_sha_from_dict,
+    md5_sha_from_str,
+)
 
 
 def test_basic_md5_sha():
@@ -94,3 +99,18 @@ def test_ignore_nan_md5_sha():
 
     assert md5_sha_from_str(serialized_obj) == md5_sha_from_dict(obj, ignore_nan=True)
     assert md5_sha_from_str(serialized_obj) == "40e87d61f6add03816bccdeac5713b9f"
+
+
+def test_basic_fast_hash():
+    obj = {
+        "product": "Coffee",
+        "price_in_cents": 4000,
+        "company": "Gobias Industries",
+    }
+
+    serialized_obj = (
+        '{"company": "Gobias Industries", "price_in_cents": 4000, "product": "Coffee"}'
+    )
+
+    assert fast_hash_from_str(serialized_obj) == fast_hash_from_dict(obj)
+    assert fast_hash_from_str(serialized_obj) == "7bac02c3f6d96765f01b7f361456c145"
@@ -0,0 +1,349 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+# pylint: disable=import-outside-toplevel
+
+from io import BytesIO
+
+from pytest_mock import MockFixture
+
+
+def test_compute_and_cache_reuses_thumbnail_of_unchanged_screenshot(
+    mocker: MockFixture,
+) -> None:
+    """
+    Test that a byte-identical screenshot reuses the cached thumbnail.
+    """
+    from superset.utils.screenshots import DashboardScreenshot
+
+    screenshot = DashboardScreenshot("http://localhost/dashboard/1/", "digest")
+    mocker.patch.object(DashboardScreenshot, "get_screenshot", return_value=b"raw")
+    resize_image = mocker.patch.object(DashboardScreenshot, "resize_image")
+    cache = mocker.MagicMock()
+    cache.get.return_value = b"thumb"
+
+    assert screenshot.compute_and_cache(cache=cache) == b"thumb"
+    resize_image.assert_not_called()
+    cache.get.assert_called_with(screenshot.content_cache_key(b"raw"))
+    assert cache.set.call_args_list == [
+        mocker.call(screenshot.cache_key(), b"thumb"),
+        mocker.call(f"{screenshot.cache_key()}:b64", b"dGh1bWI="),
+    ]
+
+
+def test_compute_and_cache_caches_thumbnail_by_content(mocker: MockFixture) -> None:
+    """
+    Test that a new thumbnail is cached under both its digest and content keys.
+    """
+    from superset.utils.screenshots import DashboardScreenshot
+
+    screenshot = DashboardScreenshot("http://localhost/dashboard/1/", "digest")
+    mocker.patch.object(DashboardScreenshot, "get_screenshot", return_value=b"raw")
+    mocker.patch.object(DashboardScreenshot, "resize_image", return_value=b"thumb")
+    cache = mocker.MagicMock()
+    cache.get.return_value = None
+
+    assert screenshot.compute_and_cache(cache=cache) == b"thumb"
+    cache.set.assert_any_call(screenshot.content_cache_key(b"raw"), b"thumb")
+    cache.set.assert_any_call(screenshot.cache_key(), b"thumb")
+    cache.set.assert_any_call(f"{screenshot.cache_key()}:b64", b"dGh1bWI=")
+
+
+def test_compute_and_cache_encodes_thumbnail_format(mocker: MockFixture) -> None:
+    """
+    Test that screenshots are encoded in the thumbnail format even when they
+    aren't resized.
+    """
+    from superset.utils.screenshots import ChartScreenshot, DashboardScreenshot
+
+    cache = mocker.MagicMock()
+    cache.get.return_value = None
+    for cls, resized in ((ChartScreenshot, False), (DashboardScreenshot, True)):
+        screenshot = cls("http://localhost/", "digest")
+        mocker.patch.object(cls, "get_screenshot", return_value=b"raw")
+        resize_image = mocker.patch.object(cls, "resize_image", return_value=b"thumb")
+
+        screenshot.compute_and_cache(
+            cache=cache, window_size=(800, 600), thumb_size=(800, 600)
+        )
+        if resized:
+            resize_image.assert_called_once_with(
+                b"raw", output="webp", thumb_size=(800, 600)
+            )
+        else:
+            resize_image.assert_not_called()
+
+
+def test_cache_key_is_memoized(mocker: MockFixture) -> None:
+    """
+    Test that cache keys are only hashed once per window and thumbnail size.
+    """
+    from superset.utils.screenshots import ChartScreenshot
+
+    fast_hash_from_dict = mocker.patch(
+        "superset.utils.screenshots.fast_hash_from_dict", return_value="key"
+    )
+    screenshot = ChartScreenshot("http://localhost/explore/", "digest")
+
+    assert screenshot.cache_key() == "key"
+    assert screenshot.cache_key((800, 600), [800, 600]) == "key"
+    fast_hash_from_dict.assert_called_once()
+
+
+def test_compute_and_cache_waits_for_concurrent_computation(
+    mocker: MockFixture,
+) -> None:
+    """
+    Test that a thumbnail being computed elsewhere is waited for, not recomputed.
+    """
+    from superset.utils.screenshots import DashboardScreenshot
+
+    mocker.patch("superset.utils.screenshots.time.sleep")
+    screenshot = DashboardScreenshot("http://localhost/dashboard/1/", "digest")
+    get_screenshot = mocker.patch.object(DashboardScreenshot, "get_screenshot")
+    cache = mocker.MagicMock()
+    cache.add.return_value = False
+    cache.get.side_effect = [None, b"thumb"]
+
+    assert screenshot.compute_and_cache(cache=cache) == b"thumb"
+    get_screenshot.assert_not_called()
+    cache.delete.assert_not_called()
+
+
+def test_get_many_from_cache(mocker: MockFixture) -> None:
+    """
+    Test that thumbnails are fetched from the cache in a single call.
+    """
+    from superset.utils.screenshots import BaseScreenshot, DashboardScreenshot
+
+    screenshots = [
+        DashboardScreenshot(f"http://localhost/dashboard/{i}/", str(i))
+        for i in range(2)
+    ]
+    cache = mocker.MagicMock()
+    cache.get_many.return_value = [b"thumb", None]
+
+    thumbnails = BaseScreenshot.get_many_from_cache(cache, screenshots)
+    assert list(thumbnails) == [screenshots[0].cache_key()]
+    assert thumbnails[screenshots[0].cache_key()].getvalue() == b"thumb"
+    cache.get_many.assert_called_once_with(
+        *[screenshot.cache_key() for screenshot in screenshots]
+    )
+
+
+def test_screenshot_sizes() -> None:
+    """
+    Test that screenshots default to the sizes of their class.
+    """
+    from superset.utils.screenshots import ChartScreenshot, DashboardScreenshot
+
+    screenshot = DashboardScreenshot("http://localhost/dashboard/1/", "digest")
+    assert screenshot.window_size == (1600, 1200)
+    assert screenshot.thumb_size == (800, 600)
+
+    screenshot = ChartScreenshot("http://localhost/explore/", "digest", (400, 300))
+    assert screenshot.window_size == (400, 300)
+    assert screenshot.thumb_size == (800, 600)
+    assert not hasattr(screenshot, "__dict__")
+
+
+def test_resize_image_crops_to_window_ratio() -> None:
+    """
+    Test that screenshots are cropped to the window's aspect ratio and resized.
+    """
+    from PIL import Image
+
+    from superset.utils.screenshots import DashboardScreenshot
+
+    with BytesIO() as screenshot:
+        Image.new("RGBA", (1600, 2000), "red").save(screenshot, "png")
+        thumbnail = DashboardScreenshot.resize_image(
+            screenshot.getvalue(), thumb_size=(800, 600)
+        )
+
+    img = Image.open(BytesIO(thumbnail))
+    assert img.format == "PNG"
+    assert img.size == (800, 600)
+    assert img.getpixel((400, 599)) == (255, 0, 0, 255)
+
+
+def test_get_b64(mocker: MockFixture) -> None:
+    """
+    Test that the base64 encoded thumbnail is read from cache, and that thumbnails
+    cached without it are encoded without writing it back.
+    """
+    from superset.utils.screenshots import ChartScreenshot
+
+    screenshot = ChartScreenshot("http://localhost/explore/", "digest")
+    cache_key = screenshot.cache_key()
+    cache = mocker.MagicMock()
+
+    cache.get.side_effect = {f"{cache_key}:b64": b"dGh1bWI="}.get
+    assert screenshot.get_b64(cache) == b"dGh1bWI="
+
+    cache.get.side_effect = {cache_key: b"thumb"}.get
+    assert screenshot.get_b64(cache) == b"dGh1bWI="
+    cache.set.assert_not_called()
+
+
+def test_standalone_url() -> None:
+    """
+    Test that screenshots are captured in the standalone mode of their type.
+    """
+    from superset.utils.screenshots import ChartScreenshot, DashboardScreenshot
+
+    screenshot = ChartScreenshot("http://localhost/explore/?slice_id=1", "digest")
+    assert screenshot.url == "http://localhost/explore/?slice_id=1"
+    assert (
+        screenshot.standalone_url
+        == "http://localhost/explore/?slice_id=1&standalone=true"
+    )
+
+    screenshot = DashboardScreenshot("http://localhost/dashboard/1/", "digest")
+    assert screenshot.standalone_url == "http://localhost/dashboard/1/?standalone=3"
+
+
+def test_resize_image_drops_alpha_for_webp() -> None:
+    """
+    Test that thumbnails encoded without an alpha channel are resized as RGB.
+    """
+    from PIL import Image
+
+    from superset.utils.screenshots import DashboardScreenshot
+
+    with BytesIO() as screenshot:
+        Image.new("RGBA", (1600, 1200), "red").save(screenshot, "png")
+        thumbnail = DashboardScreenshot.resize_image(
+            screenshot.getvalue(), output="webp", thumb_size=(700, 500)
+        )
+
+    img = Image.open(BytesIO(thumbnail))
+    assert img.format == "WEBP"
+    assert img.mode == "RGB"
+    assert img.size == (700, 500)
+
+
+def test_decode_png_with_imagecodecs(mocker: MockFixture) -> None:
+    """
+    Test that screenshots are decoded with imagecodecs when it's installed.
+    """
+    import numpy as np
+
+    from superset.utils.screenshots import _decode_png
+
+    arr = np.zeros((2, 3, 4), dtype=np.uint8)
+    arr[..., 0] = arr[..., 3] = 255
+    imagecodecs = mocker.patch("superset.utils.screenshots.imagecodecs")
+    imagecodecs.png_decode.return_value = arr
+
+    img = _decode_png(b"png")
+    assert img.mode == "RGBA"
+    assert img.size == (3, 2)
+    assert img.getpixel((2, 1)) == (255, 0, 0, 255)
+    imagecodecs.png_decode.assert_called_once_with(b"png")
+
+
+def test_resize_image_from_stream(mocker: MockFixture) -> None:
+    """
+    Test that streams are decoded by Pillow rather than imagecodecs.
+    """
+    from PIL import Image
+
+    from superset.utils.screenshots import ChartScreenshot
+
+    imagecodecs = mocker.patch("superset.utils.screenshots.imagecodecs")
+    with BytesIO() as screenshot:
+        Image.new("RGBA", (800, 600), "red").save(screenshot, "png")
+        thumbnail = ChartScreenshot.resize_image(screenshot, thumb_size=(400, 300))
+
+    imagecodecs.png_decode.assert_not_called()
+    assert Image.open(BytesIO(thumbnail)).size == (400, 300)
+
+
+def test_decode_png_falls_back_to_pillow(mocker: MockFixture) -> None:
+    """
+    Test that Pillow decodes the screenshot when imagecodecs is missing or can't
+    decode it.
+    """
+    import numpy as np
+    from PIL import Image
+
+    from superset.utils.screenshots import _decode_png, ChartScreenshot
+
+    with BytesIO() as screenshot:
+        Image.new("RGBA", (800, 600), "red").save(screenshot, "png")
+        img_bytes = screenshot.getvalue()
+
+    mocker.patch("superset.utils.screenshots.imagecodecs", None)
+    assert _decode_png(img_bytes) is None
+    thumbnail = ChartScreenshot.resize_image(img_bytes, output="png")
+    assert Image.open(BytesIO(thumbnail)).size == (800, 600)
+
+    imagecodecs = mocker.patch("superset.utils.screenshots.imagecodecs")
+    imagecodecs.png_decode.return_value = np.zeros((600, 800, 4), dtype=np.uint16)
+    assert _decode_png(img_bytes) is None
+
+    imagecodecs.png_decode.side_effect = RuntimeError("unsupported")
+    assert _decode_png(img_bytes) is None
+
+
+def test_resize_image_class_defaults() -> None:
+    """
+    Test that resizing uses the window and thumbnail defaults of each class.
+    """
+    from PIL import Image
+
+    from superset.utils.screenshots import ChartScreenshot, DashboardScreenshot
+
+    def screenshot(size: tuple[int, int]) -> bytes:
+        img = Image.new("RGBA", size, "red")
+        img.paste("blue", (0, size[1] - 4, size[0], size[1]))
+        with BytesIO() as buffer:
+            img.save(buffer, "png")
+            return buffer.getvalue()
+
+    # charts crop taller screenshots to 4:3, and default to 800x600 thumbnails
+    img = Image.open(
+        BytesIO(ChartScreenshot.resize_image(screenshot((800, 800)), crop=True))
+    )
+    assert img.size == (800, 600)
+    assert img.getpixel((400, 599)) == (255, 0, 0, 255)
+
+    # dashboards compare against their 1200 high window, leaving it uncropped
+    img = Image.open(
+        BytesIO(DashboardScreenshot.resize_image(screenshot((1600, 1200))))
+    )
+    assert img.size == (800, 600)
+    assert img.getpixel((400, 599)) == (0, 0, 255, 255)
+
+
+def test_resize_image_palette_mode() -> None:
+    """
+    Test that screenshots without an RGB(A) mode are resized too.
+    """
+    from PIL import Image
+
+    from superset.utils.screenshots import ChartScreenshot, DashboardScreenshot
+
+    with BytesIO() as screenshot:
+        Image.new("RGB", (1600, 1300), "red").convert("P").save(screenshot, "png")
+        img_bytes = screenshot.getvalue()
+
+    for cls, output in ((ChartScreenshot, "png"), (DashboardScreenshot, "webp")):
+        img = Image.open(
+            BytesIO(cls.resize_image(img_bytes, output=output, thumb_size=(400, 300)))
+        )
+        assert img.size == (400, 300)